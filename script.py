@@ -1,26 +1,34 @@
-import json
 import os
 import random
 import time
 import shutil
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import orjson
+from numba import njit
 
 # --- Configuration (Randomized Generation) ---
 NUM_CATEGORIES = 100
 VENDOR_COUNT = 100
-ATTRIBUTES_PER_PRODUCT = 3
 MAX_WORKERS = os.cpu_count() or 4
 SPLIT_PARTS = 4
 PRODUCTS_PER_FILE = 2500000  # 2.5 million documents per output file
 TOTAL_PRODUCTS = PRODUCTS_PER_FILE * SPLIT_PARTS  # 10 million total
+# Each file is generated by this many tasks: at least 4 per worker overall, so fast
+# workers pick up more chunks and one slow chunk can't hold up the whole run.
+CHUNKS_PER_FILE = max(16, 4 * MAX_WORKERS // SPLIT_PARTS)
+RANDOM_SEED = None  # Set to an int for reproducible output (products and base data)
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024  # 4 MB write buffer (default is 8 KB) to batch small writes
+RECORDS_PER_BATCH = 65536  # Products rendered per JIT kernel call (~14 MB of JSON)
 
 # --- File Paths ---
 OUTPUT_DIR = "generated_data"
 VENDORS_FILE = os.path.join(OUTPUT_DIR, "vendors.json")
 CATEGORIES_FILE = os.path.join(OUTPUT_DIR, "categories.json")
 
-# --- Utility Functions: Python "Faker" (unchanged) ---
+# --- Utility Functions: Python "Faker" ---
 
 WORDS = ["Electronics", "Apparel", "HomeGoods", "Tools", "Books", "Software", "Sporting"]
 PHRASES = ["Ultimate Pro Gadget", "Smart Home Device", "Vintage Look Accessory", "High Performance Tool", "Economical Choice"]
@@ -31,90 +39,262 @@ COLORS = ["Red", "Blue", "Green", "Black", "White", "Silver"]
 def get_random_word():
     return random.choice(WORDS)
 
-def get_random_phrase():
-    return random.choice(PHRASES)
+# --- Core Generation Logic (REVISED) ---
 
-def generate_attribute(attribute_index):
-    if attribute_index == 0:
-        return {"k": "RAM", "v": f"{random.choice(RAMS)}GB"}
-    elif attribute_index == 1:
-        return {"k": "Storage", "v": f"{random.choice(STORAGES)}GB SSD"}
-    else:
-        return {"k": "Color", "v": random.choice(COLORS)}
+def _byte_table(strings):
+    """Packs strings into one flat uint8 array plus (n + 1) boundary offsets."""
+    encoded = [s.encode() for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8).copy(), offsets
 
-# --- Core Generation Logic (REVISED) ---
+# The product schema is fixed, so each record is emitted as JSON bytes by the JIT
+# kernels below. Fields are interleaved with these literal segments, in order:
+#   name, price, rating, RAM, Storage, Color, category_id, vendor_id, product_id
+# Every record ends with a newline, so output files are NDJSON (one object per line).
+RECORD_SEGMENTS = [
+    '{"name":"',
+    '","price":',
+    ',"rating":',
+    ',"attributs":[{"k":"RAM","v":"',
+    '"},{"k":"Storage","v":"',
+    '"},{"k":"Color","v":"',
+    '"}],"category_id":',
+    ',"vendor_id":',
+    ',"product_id":',
+    '}\n',
+]
 
-def generate_product_json(global_product_id):
-    """Generates a single product dictionary with a randomly selected category ID."""
-    
-    attributes = [generate_attribute(i) for i in range(ATTRIBUTES_PER_PRODUCT)]
-    vendor_id = random.randrange(VENDOR_COUNT)
-    
-    # CRITICAL CHANGE: Randomly choose Category ID for *every* product
-    category_id = random.randrange(NUM_CATEGORIES)
-    
-    product = {
-        "name": get_random_phrase(),
-        "price": round(random.uniform(10.0, 5000.0), 2),
-        "rating": round(random.uniform(3.0, 5.0), 1),
-        "attributs": attributes,
-        "category_id": category_id, # This ID is now random/interleaved
-        "vendor_id": vendor_id,
-        "product_id": global_product_id
+# Module-level arrays are frozen into the compiled kernels as constants
+_SEGMENTS, _SEGMENT_OFFS = _byte_table(RECORD_SEGMENTS)
+_PHRASES, _PHRASE_OFFS = _byte_table(PHRASES)
+_COLORS, _COLOR_OFFS = _byte_table(COLORS)
+# Attribute values are pre-rendered ("8GB", "128GB SSD", ...) so the kernels copy them
+# with a single table lookup instead of formatting numbers per product
+_RAM_STRS, _RAM_OFFS = _byte_table([f"{r}GB" for r in RAMS])
+_STORAGE_STRS, _STORAGE_OFFS = _byte_table([f"{s}GB SSD" for s in STORAGES])
+# Bytes every record has: the literal segments, plus "." and the fractional
+# digits of price (2) and rating (1).
+_FIXED_RECORD_LEN = len(_SEGMENTS) + 3 + 2
+
+@njit(cache=True)
+def _num_digits(v):
+    n = 1
+    while v >= 10:
+        v //= 10
+        n += 1
+    return n
+
+@njit(cache=True)
+def _put_int(buf, pos, v):
+    end = pos + _num_digits(v)
+    i = end
+    while True:
+        i -= 1
+        buf[i] = 48 + v % 10
+        v //= 10
+        if v == 0:
+            break
+    return end
+
+@njit(cache=True)
+def _put_table(buf, pos, table, offsets, idx):
+    for k in range(offsets[idx], offsets[idx + 1]):
+        buf[pos] = table[k]
+        pos += 1
+    return pos
+
+# The kernels are single-threaded: every worker process already renders its own chunk
+@njit(cache=True)
+def record_lengths(lengths, phrase_idx, price_cents, rating_tenths, ram_idx, stor_idx, col_idx,
+                   cat_ids, vendor_ids, start_id):
+    """Writes the exact byte length of every record into `lengths`, so offsets are known up front."""
+    n = len(cat_ids)
+    for i in range(n):
+        lengths[i] = (_FIXED_RECORD_LEN
+                      + _PHRASE_OFFS[phrase_idx[i] + 1] - _PHRASE_OFFS[phrase_idx[i]]
+                      + _num_digits(price_cents[i] // 100)
+                      + _num_digits(rating_tenths[i] // 10)
+                      + _RAM_OFFS[ram_idx[i] + 1] - _RAM_OFFS[ram_idx[i]]
+                      + _STORAGE_OFFS[stor_idx[i] + 1] - _STORAGE_OFFS[stor_idx[i]]
+                      + _COLOR_OFFS[col_idx[i] + 1] - _COLOR_OFFS[col_idx[i]]
+                      + _num_digits(cat_ids[i])
+                      + _num_digits(vendor_ids[i])
+                      + _num_digits(start_id + i))
+
+@njit(cache=True)
+def fill_buffer(buf, offsets, phrase_idx, price_cents, rating_tenths, ram_idx, stor_idx, col_idx,
+                cat_ids, vendor_ids, start_id):
+    """Renders record i into buf[offsets[i]:offsets[i + 1]] and returns the bytes written."""
+    n = len(cat_ids)
+    for i in range(n):
+        pos = _put_table(buf, offsets[i], _SEGMENTS, _SEGMENT_OFFS, 0)
+        pos = _put_table(buf, pos, _PHRASES, _PHRASE_OFFS, phrase_idx[i])
+        pos = _put_table(buf, pos, _SEGMENTS, _SEGMENT_OFFS, 1)
+        pos = _put_int(buf, pos, price_cents[i] // 100)
+        buf[pos] = 46  # "."
+        buf[pos + 1] = 48 + (price_cents[i] // 10) % 10
+        buf[pos + 2] = 48 + price_cents[i] % 10
+        pos = _put_table(buf, pos + 3, _SEGMENTS, _SEGMENT_OFFS, 2)
+        pos = _put_int(buf, pos, rating_tenths[i] // 10)
+        buf[pos] = 46  # "."
+        buf[pos + 1] = 48 + rating_tenths[i] % 10
+        pos = _put_table(buf, pos + 2, _SEGMENTS, _SEGMENT_OFFS, 3)
+        pos = _put_table(buf, pos, _RAM_STRS, _RAM_OFFS, ram_idx[i])
+        pos = _put_table(buf, pos, _SEGMENTS, _SEGMENT_OFFS, 4)
+        pos = _put_table(buf, pos, _STORAGE_STRS, _STORAGE_OFFS, stor_idx[i])
+        pos = _put_table(buf, pos, _SEGMENTS, _SEGMENT_OFFS, 5)
+        pos = _put_table(buf, pos, _COLORS, _COLOR_OFFS, col_idx[i])
+        pos = _put_table(buf, pos, _SEGMENTS, _SEGMENT_OFFS, 6)
+        pos = _put_int(buf, pos, cat_ids[i])
+        pos = _put_table(buf, pos, _SEGMENTS, _SEGMENT_OFFS, 7)
+        pos = _put_int(buf, pos, vendor_ids[i])
+        pos = _put_table(buf, pos, _SEGMENTS, _SEGMENT_OFFS, 8)
+        pos = _put_int(buf, pos, start_id + i)
+        _put_table(buf, pos, _SEGMENTS, _SEGMENT_OFFS, 9)
+    return offsets[n]
+
+
+def sample_product_fields(rng, count):
+    """
+    Draws every random field for `count` products in one vectorized pass,
+    instead of calling the scalar `random` module several times per product.
+    """
+    return {
+        "phrase_idx": rng.integers(0, len(PHRASES), count, dtype=np.int32),
+        "price": np.round(rng.uniform(10.0, 5000.0, count), 2),
+        "rating": np.round(rng.uniform(3.0, 5.0, count), 1),
+        "ram_idx": rng.integers(0, len(RAMS), count, dtype=np.int32),
+        "stor_idx": rng.integers(0, len(STORAGES), count, dtype=np.int32),
+        "col_idx": rng.integers(0, len(COLORS), count, dtype=np.int32),
+        # CRITICAL CHANGE: Randomly choose Category ID for *every* product
+        "category_id": rng.integers(0, NUM_CATEGORIES, count, dtype=np.int32),
+        "vendor_id": rng.integers(0, VENDOR_COUNT, count, dtype=np.int32),
     }
-    return product, vendor_id, category_id
 
 
-def generate_interleaved_products_for_file(file_part_index, start_product_id):
+def product_file_path(file_part_index):
+    return os.path.join(OUTPUT_DIR, f"products_part_{file_part_index}.jsonl")
+
+def chunk_path(file_part_index, chunk_index):
+    return os.path.join(OUTPUT_DIR, f"products_part_{file_part_index}_{chunk_index}.chunk")
+
+def remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# --- Worker State ---
+# One row per chunk task: category counts followed by vendor counts. Every chunk
+# writes only its own row, so no lock is needed, and the parent sums just the rows
+# of chunks that ended up in a written file.
+_COUNTS_SHM = None
+_COUNTS = None
+# Entropy of the run's root SeedSequence; every chunk derives its own stream from it
+_SEED_ENTROPY = None
+
+def _init_worker(counts_shm_name, num_tasks, seed_entropy):
+    """Runs once per worker process: attaches the shared counts array and seeds the RNG root."""
+    global _COUNTS_SHM, _COUNTS, _SEED_ENTROPY
+    _SEED_ENTROPY = seed_entropy
+    # Left attached for the worker's lifetime: close() would fail while _COUNTS still
+    # views the buffer, and the mapping is released when the worker process exits.
+    # The parent owns the segment and unlinks it.
+    _COUNTS_SHM = SharedMemory(name=counts_shm_name)
+    _COUNTS = np.ndarray((num_tasks, NUM_CATEGORIES + VENDOR_COUNT), dtype=np.int64, buffer=_COUNTS_SHM.buf)
+
+
+def generate_interleaved_products_for_file(file_part_index, chunk_index, start_product_id, product_count, stream_index):
     """
-    Generates PRODUCTS_PER_FILE products, streaming them to a single output file,
-    and recording category/vendor counts.
+    Generates one chunk of products for a split file, streaming them to a
+    temporary chunk file, and recording its category/vendor counts in its
+    row of the shared counts array. The chunk holds one JSON object per line.
     """
     start_time = time.time()
-    output_path = os.path.join(OUTPUT_DIR, f"products_part_{file_part_index}.json")
-    print(f"-> Generating {PRODUCTS_PER_FILE} products for File {file_part_index}...")
+    output_path = chunk_path(file_part_index, chunk_index)
+    print(f"-> Generating {product_count} products for File {file_part_index} (chunk {chunk_index})...")
+
+    # Same stream as SeedSequence(entropy).spawn(...)[stream_index]: independent per
+    # chunk and reproducible no matter which worker picks the chunk up
+    rng = np.random.default_rng(np.random.SeedSequence(_SEED_ENTROPY, spawn_key=(stream_index,)))
+    fields = sample_product_fields(rng, product_count)
+
+    # Count usage for reporting and base data update (vectorized, no per-product dict ops)
+    category_counts = np.bincount(fields["category_id"], minlength=NUM_CATEGORIES)
+    vendor_counts = np.bincount(fields["vendor_id"], minlength=VENDOR_COUNT)
+
+    # Fixed-point price/rating so the kernels can emit them as integer digits
+    price_cents = np.rint(fields["price"] * 100).astype(np.int64)
+    rating_tenths = np.rint(fields["rating"] * 10).astype(np.int64)
+
+    # Offsets and output buffer are reused by every batch instead of being reallocated;
+    # the buffer only grows when a batch renders larger than anything seen so far
+    offsets = np.zeros(RECORDS_PER_BATCH + 1, dtype=np.int64)
+    buf = np.empty(0, dtype=np.uint8)
 
-    vendor_counts = defaultdict(int)
-    category_counts = defaultdict(int)
-    
     try:
-        with open(output_path, 'w') as f:
-            f.write("[\n") # Start JSON array
-            
-            for i in range(PRODUCTS_PER_FILE):
-                global_product_id = start_product_id + i
-                product, vendor_id, category_id = generate_product_json(global_product_id)
-                
-                # Count usage for reporting and base data update
-                vendor_counts[vendor_id] += 1
-                category_counts[category_id] += 1
-                
-                # Write the object. Add separator before all objects except the first
-                if i > 0:
-                    f.write(",\n")
-                
-                f.write(json.dumps(product))
-                
-            f.write("\n]") # End JSON array
+        with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            for lo in range(0, product_count, RECORDS_PER_BATCH):
+                hi = min(lo + RECORDS_PER_BATCH, product_count)
+                batch = (
+                    fields["phrase_idx"][lo:hi], price_cents[lo:hi], rating_tenths[lo:hi],
+                    fields["ram_idx"][lo:hi], fields["stor_idx"][lo:hi], fields["col_idx"][lo:hi],
+                    fields["category_id"][lo:hi], fields["vendor_id"][lo:hi], start_product_id + lo
+                )
+                batch_offsets = offsets[:hi - lo + 1]
+                record_lengths(batch_offsets[1:], *batch)
+                np.cumsum(batch_offsets[1:], out=batch_offsets[1:])
+                if batch_offsets[-1] > len(buf):
+                    buf = np.empty(batch_offsets[-1], dtype=np.uint8)
+                n = fill_buffer(buf, batch_offsets, *batch)
+                f.write(memoryview(buf)[:n])
 
     except Exception as e:
-        print(f"Error writing file {file_part_index}: {e}")
+        print(f"Error writing file {file_part_index} (chunk {chunk_index}): {e}")
         return None
 
+    _COUNTS[stream_index, :NUM_CATEGORIES] = category_counts
+    _COUNTS[stream_index, NUM_CATEGORIES:] = vendor_counts
+
     duration = time.time() - start_time
-    print(f"<- Finished File {file_part_index}. Saved {PRODUCTS_PER_FILE} products in {duration:.2f}s.")
+    print(f"<- Finished File {file_part_index} (chunk {chunk_index}). Saved {product_count} products in {duration:.2f}s.")
     
-    # Return counts to be aggregated in the main thread
-    return {
-        "file_index": file_part_index,
-        "category_counts": dict(category_counts),
-        "vendor_counts": dict(vendor_counts)
-    }
+    # Everything the parent needs is already in the chunk file and the counts row,
+    # so only a success flag crosses the process boundary
+    return True
+
+
+def concatenate_chunks(file_part_index, chunk_indices):
+    """Joins the NDJSON chunk files of one split file into the final file and removes them."""
+    output_path = product_file_path(file_part_index)
+    with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        for chunk_index in chunk_indices:
+            path = chunk_path(file_part_index, chunk_index)
+            with open(path, 'rb') as chunk:
+                shutil.copyfileobj(chunk, f, WRITE_BUFFER_SIZE)
+            os.remove(path)
+        drop_from_page_cache(f)
+
+
+def drop_from_page_cache(f):
+    """
+    Flushes a finished output file to disk and hints the kernel to evict its pages,
+    so gigabytes of generated data don't push MongoDB's working set out of the
+    page cache. No-op on platforms without posix_fadvise (e.g. Windows).
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    f.flush()
+    # DONTNEED only drops clean pages, so write them back first
+    os.fdatasync(f.fileno())
+    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
 
 # --- Base Data and Orchestration ---
 
 def generate_base_data(categories_data, vendors_data):
-    """Generates and writes initial categories and vendors data."""
+    """Builds the categories and vendors data in memory (written once counts are known)."""
     # 1. Categories
     for i in range(NUM_CATEGORIES):
         categories_data.append({
@@ -130,49 +310,25 @@ def generate_base_data(categories_data, vendors_data):
             "full_name": f"Vendor Company {i}",
             "products_count": 0 # Will be updated after generation
         })
-    
-    # Write initial files with zero counts
-    with open(CATEGORIES_FILE, 'w') as f:
-        json.dump(categories_data, f, indent=2)
-    with open(VENDORS_FILE, 'w') as f:
-        json.dump(vendors_data, f, indent=2)
 
 
-def update_base_data_counts(results):
-    """Aggregates counts from all processes and updates base data files."""
-    
-    # Initialize total aggregators
-    total_vendor_counts = defaultdict(int)
-    total_category_counts = defaultdict(int)
-
-    # 1. Aggregate all counts
-    for result in results:
-        if result is None: continue
-        for cat_id, count in result["category_counts"].items():
-            total_category_counts[cat_id] += count
-        for ven_id, count in result["vendor_counts"].items():
-            total_vendor_counts[ven_id] += count
-
-    # 2. Load existing base data
-    with open(CATEGORIES_FILE, 'r') as f:
-        categories_data = json.load(f)
-    with open(VENDORS_FILE, 'r') as f:
-        vendors_data = json.load(f)
-
-    # 3. Update products_count fields
+def update_base_data_counts(categories_data, vendors_data, total_category_counts, total_vendor_counts):
+    """Applies the aggregated counts (index = category/vendor id) and writes the base data files."""
+
+    # 1. Update products_count fields
     for cat in categories_data:
         cat_id = cat["_id"]
-        cat["products_count"] = total_category_counts[cat_id]
+        cat["products_count"] = int(total_category_counts[cat_id])
         
     for vendor in vendors_data:
         ven_id = vendor["_id"]
-        vendor["products_count"] = total_vendor_counts[ven_id]
+        vendor["products_count"] = int(total_vendor_counts[ven_id])
 
-    # 4. Write updated base files
-    with open(CATEGORIES_FILE, 'w') as f:
-        json.dump(categories_data, f, indent=2)
-    with open(VENDORS_FILE, 'w') as f:
-        json.dump(vendors_data, f, indent=2)
+    # 2. Write base files
+    with open(CATEGORIES_FILE, 'wb') as f:
+        f.write(orjson.dumps(categories_data, option=orjson.OPT_INDENT_2))
+    with open(VENDORS_FILE, 'wb') as f:
+        f.write(orjson.dumps(vendors_data, option=orjson.OPT_INDENT_2))
     
     print("\n--- Base Data Counts Updated Successfully ---")
 
@@ -180,32 +336,74 @@ def update_base_data_counts(results):
 def run_interleaved_generation():
     """Orchestrates the concurrent generation of the four final split files."""
     print(f"\n--- Starting Interleaved Product Generation ---")
-    print(f"Total products to generate: {TOTAL_PRODUCTS} (4 files x {PRODUCTS_PER_FILE} each)")
-    print(f"Using {MAX_WORKERS} processes...")
+    print(f"Total products to generate: {TOTAL_PRODUCTS} ({SPLIT_PARTS} files x {PRODUCTS_PER_FILE} each)")
+    print(f"Using {MAX_WORKERS} processes, {CHUNKS_PER_FILE} chunks per file...")
     
-    # We will launch 4 tasks, one for each final split file
+    # Split every file into CHUNKS_PER_FILE tasks so all workers stay busy,
+    # each with its own independent random stream
+    seed_entropy = np.random.SeedSequence(RANDOM_SEED).entropy
     tasks = []
     current_product_id = 0
     for i in range(1, SPLIT_PARTS + 1):
-        tasks.append((i, current_product_id))
-        current_product_id += PRODUCTS_PER_FILE
+        for k in range(CHUNKS_PER_FILE):
+            count = PRODUCTS_PER_FILE // CHUNKS_PER_FILE + (1 if k < PRODUCTS_PER_FILE % CHUNKS_PER_FILE else 0)
+            tasks.append((i, k, current_product_id, count, len(tasks)))
+            current_product_id += count
 
-    results = []
-    
-    # Use ProcessPoolExecutor for true parallel execution
-    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(generate_interleaved_products_for_file, file_idx, start_id) 
-                   for file_idx, start_id in tasks}
-        
-        for future in as_completed(futures):
-            try:
-                result = future.result()
+    # Workers record their counts straight into shared memory instead of pickling
+    # them back, so the transfer cost doesn't grow with the number of chunks
+    counts_shm = SharedMemory(create=True, size=8 * len(tasks) * (NUM_CATEGORIES + VENDOR_COUNT))
+    written_files = []
+    written_streams = []
+    try:
+        counts = np.ndarray((len(tasks), NUM_CATEGORIES + VENDOR_COUNT), dtype=np.int64, buffer=counts_shm.buf)
+        counts[:] = 0
+
+        # Use ProcessPoolExecutor for true parallel execution
+        with ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=_init_worker,
+                                 initargs=(counts_shm.name, len(tasks), seed_entropy)) as executor:
+            # Futures are consumed in task order (file by file), so each split file is
+            # assembled as soon as its last chunk is done while later ones generate.
+            # A failing chunk only costs that chunk, never the remaining files.
+            futures = [executor.submit(generate_interleaved_products_for_file, *task) for task in tasks]
+            file_chunks = []
+            for (file_idx, chunk_idx, _, _, stream_idx), future in zip(tasks, futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error during file {file_idx} (chunk {chunk_idx}) generation: {e}")
+                    result = None
                 if result:
-                    results.append(result)
-            except Exception as e:
-                print(f"Error during file generation: {e}")
-                
-    return results
+                    file_chunks.append((chunk_idx, stream_idx))
+                else:
+                    remove_if_exists(chunk_path(file_idx, chunk_idx))
+
+                if chunk_idx < CHUNKS_PER_FILE - 1:
+                    continue
+                if len(file_chunks) < CHUNKS_PER_FILE:
+                    print(f"Warning: File {file_idx} is missing {CHUNKS_PER_FILE - len(file_chunks)} chunk(s).")
+                if file_chunks:
+                    try:
+                        concatenate_chunks(file_idx, [c for c, _ in file_chunks])
+                        written_files.append(product_file_path(file_idx))
+                        written_streams.extend(s for _, s in file_chunks)
+                    except Exception as e:
+                        print(f"Error assembling file {file_idx}: {e}")
+                        remove_if_exists(product_file_path(file_idx))
+                        for c, _ in file_chunks:
+                            remove_if_exists(chunk_path(file_idx, c))
+                file_chunks = []
+
+        # Only products that made it into a written file are counted
+        totals = counts[written_streams].sum(axis=0)
+        category_counts = totals[:NUM_CATEGORIES]
+        vendor_counts = totals[NUM_CATEGORIES:]
+        del counts  # Release the view so the segment can be closed
+    finally:
+        counts_shm.close()
+        counts_shm.unlink()
+
+    return category_counts, vendor_counts, written_files
 
 # --- Execution ---
 
@@ -214,22 +412,27 @@ if __name__ == '__main__':
     
     # Setup directories
     os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    # Category labels use the stdlib RNG; seed it too so base data is reproducible
+    random.seed(RANDOM_SEED)
     
-    # Generate initial base data structure (zero counts)
+    # Generate initial base data structure in memory (zero counts)
     categories_data = []
     vendors_data = []
-    print("Generating Categories and Vendors structure files...")
+    print("Generating Categories and Vendors structure...")
     generate_base_data(categories_data, vendors_data)
     
     # 1. Concurrent product generation (writes directly to final split files)
-    all_counts = run_interleaved_generation()
+    category_counts, vendor_counts, written_files = run_interleaved_generation()
     
-    # 2. Update base data counts based on generation results
-    update_base_data_counts(all_counts)
+    # 2. Update base data counts based on generation results and write the files once
+    update_base_data_counts(categories_data, vendors_data, category_counts, vendor_counts)
     
     print("\n--- Generation Complete ---")
-    for i in range(1, SPLIT_PARTS + 1):
-        print(f"File {i} saved to: {os.path.join(OUTPUT_DIR, f'products_part_{i}.json')}")
+    for path in written_files:
+        print(f"Saved: {path}")
+    if len(written_files) < SPLIT_PARTS:
+        print(f"Warning: only {len(written_files)} of {SPLIT_PARTS} product files were written.")
     
     end_time = time.time()
     duration = end_time - start_time